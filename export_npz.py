@@ -0,0 +1,18 @@
+"""One-off export of the trained MLP's weights to a raw .npz archive
+
+The app only needs the weight/bias arrays and the activation names, so
+serving can load mlp.npz directly instead of unpickling the estimator.
+"""
+import joblib
+import numpy as np
+
+model = joblib.load('best_mlp_model.pkl')
+
+arrays = {f'W{i}': W for i, W in enumerate(model.coefs_)}
+arrays.update({f'b{i}': b for i, b in enumerate(model.intercepts_)})
+arrays['activation'] = np.array(model.activation)
+arrays['out_activation'] = np.array(model.out_activation_)
+
+np.savez('mlp.npz', **arrays)
+
+print("Saved mlp.npz")
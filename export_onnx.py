@@ -0,0 +1,24 @@
+"""One-off conversion of the trained MLP to ONNX for serving with onnxruntime"""
+import joblib
+from skl2onnx import convert_sklearn
+from skl2onnx.common.data_types import FloatTensorType
+from onnxruntime.quantization import quantize_dynamic, QuantType
+
+model = joblib.load('best_mlp_model.pkl')
+
+onnx_model = convert_sklearn(
+    model,
+    initial_types=[('X', FloatTensorType([None, 4]))],
+    options={id(model): {'zipmap': False}}  # plain (N, 2) probability array
+)
+
+with open('model.onnx', 'wb') as f:
+    f.write(onnx_model.SerializeToString())
+
+print("Saved model.onnx")
+
+# Dynamic int8 quantization of the MatMul weights: halves the weight
+# footprint and enables int8 dot-products on CPUs that support them
+quantize_dynamic('model.onnx', 'model.int8.onnx', weight_type=QuantType.QInt8)
+
+print("Saved model.int8.onnx")
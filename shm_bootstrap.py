@@ -0,0 +1,65 @@
+"""Publish the MLP weights once into POSIX shared memory
+
+For multi-worker deployments every worker's cached loader otherwise
+keeps its own copy of the weights. Run this once per host before
+starting the workers:
+
+    python shm_bootstrap.py
+
+It copies the arrays from mlp.npz into one shared segment and writes
+mlp_shm.json with the segment name and per-array offsets; workers
+attach zero-copy views through that index. Tear down by deleting the
+index file and unlinking the segment (SharedMemory(name=...).unlink()).
+"""
+import json
+import os
+from multiprocessing import shared_memory, resource_tracker
+
+import numpy as np
+
+SHM_NAME = 'nnt_mlp_weights'
+
+here = os.path.dirname(os.path.abspath(__file__))
+archive = np.load(os.path.join(here, 'mlp.npz'))
+
+# float32 C-contiguous so worker-side _NumpyMLP wraps the views without
+# copying them back out of the segment
+names = sorted(k for k in archive.files if k[0] in 'Wb')
+arrays = {k: np.ascontiguousarray(archive[k], dtype=np.float32) for k in names}
+total_bytes = sum(a.nbytes for a in arrays.values())
+
+# Replace any stale segment from a previous run
+try:
+    stale = shared_memory.SharedMemory(name=SHM_NAME)
+    stale.unlink()
+    stale.close()
+except FileNotFoundError:
+    pass
+
+shm = shared_memory.SharedMemory(name=SHM_NAME, create=True, size=total_bytes)
+
+index = {
+    'shm_name': SHM_NAME,
+    'activation': str(archive['activation']),
+    'out_activation': str(archive['out_activation']),
+    'arrays': {},
+}
+offset = 0
+for name, array in arrays.items():
+    view = np.ndarray(array.shape, dtype=array.dtype, buffer=shm.buf,
+                      offset=offset)
+    view[...] = array
+    index['arrays'][name] = {'offset': offset, 'shape': list(array.shape),
+                             'dtype': str(array.dtype)}
+    offset += array.nbytes
+
+with open(os.path.join(here, 'mlp_shm.json'), 'w') as f:
+    json.dump(index, f, indent=2)
+
+# The resource tracker would unlink the segment when this process exits,
+# destroying it before the workers start; the segment must outlive us
+resource_tracker.unregister(shm._name, 'shared_memory')
+shm.close()
+
+print(f"Published {total_bytes} bytes to shared memory '{SHM_NAME}' "
+      f"({len(arrays)} arrays); index written to mlp_shm.json")
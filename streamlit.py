@@ -1,126 +1,435 @@
-import pandas as pd
-import pickle
-import joblib
-import streamlit as st
-import numpy as np
-from pathlib import Path
-
-# Page configuration
-st.set_page_config(
-    page_title="Melanoma SLN Metastasis Predictor",
-    layout="centered",
-    page_icon=":hospital:"
-)
-
-# Custom styling
-st.markdown("""
-<style>
-    .header-style { font-size:24px; font-weight:bold; color:#2a52be; }
-    .result-positive { color:#d62728; font-weight:bold; font-size:28px; }
-    .result-negative { color:#2ca02c; font-weight:bold; font-size:28px; }
-    .feature-header { font-size:18px; font-weight:bold; color:#2a52be; margin-top:15px; }
-</style>
-""", unsafe_allow_html=True)
-
-# Model path
-MODEL_PATH = Path('best_mlp_model.pkl')
-
-@st.cache_resource
-def load_model(model_path):
-    """Load trained model"""
-    try:
-        # Try joblib first
-        try:
-            model = joblib.load(model_path)
-            if hasattr(model, 'predict_proba'):
-                return model
-        except:
-            pass
-
-        # Try pickle
-        with open(model_path, 'rb') as f:
-            loaded_data = pickle.load(f)
-            if isinstance(loaded_data, dict) and 'model' in loaded_data:
-                model = loaded_data['model']
-                if hasattr(model, 'predict_proba'):
-                    return model
-
-        raise Exception("No valid model found")
-    except Exception as e:
-        st.error(f"Model loading failed: {str(e)}")
-        return None
-
-# Load model
-model = load_model(MODEL_PATH)
-if model is None:
-    st.stop()
-
-# App header
-st.title("Melanoma Sentinel Lymph Node Metastasis Predictor")
-st.markdown("<div class='header-style'>Clinical Decision Support Tool</div>", unsafe_allow_html=True)
-
-# Input features
-with st.form("patient_parameters"):
-    st.markdown("<div class='feature-header'>Tumor Characteristics</div>", unsafe_allow_html=True)
-    breslow = st.slider("Breslow Thickness (mm)", 0.0, 10.0, 4.0, 0.1,
-                        help="Measured depth of tumor invasion")
-    ki67 = st.slider("Ki67 Proliferation Index (%)", 0.0, 100.0, 0.0, 0.1,
-                     help="Percentage of Ki67-positive tumor cells")
-
-    st.markdown("<div class='feature-header'>Clinical Features</div>", unsafe_allow_html=True)
-    subungual = st.radio("Subungual Melanoma?", options=["No", "Yes"],
-                         help="Is the melanoma located under the nail?")
-    treatment = st.radio("Prior Treatment Received?", options=["No", "Yes"],
-                         help="Has the patient received any prior treatment?")
-
-    submitted = st.form_submit_button("Calculate Metastasis Risk")
-
-# Prepare input data
-if submitted:
-    input_data = pd.DataFrame({
-        'Subtype': [1 if subungual == "Yes" else 0],
-        'Breslow_Thickness': [breslow],
-        'Ki67': [ki67],
-        'Supplementary_Check': [1 if treatment == "Yes" else 0]
-    })
-
-    # Ensure consistent column order
-    expected_columns = ['Subtype', 'Breslow_Thickness', 'Ki67', 'Supplementary_Check']
-    input_data = input_data[expected_columns]
-
-    with st.spinner("Analyzing patient data..."):
-        try:
-            # Get prediction probabilities
-            predicted_probs = model.predict_proba(input_data)
-            probability = predicted_probs[0][1]  # Get positive class probability
-
-            # Display prediction result
-            st.markdown("---")
-            if probability >= 0.5:
-                st.markdown(
-                    f"<div class='result-positive'>High Risk: {probability:.1%} probability of metastasis</div>",
-                    unsafe_allow_html=True)
-            else:
-                st.markdown(f"<div class='result-negative'>Low Risk: {probability:.1%} probability of metastasis</div>",
-                            unsafe_allow_html=True)
-
-            # Display input values for reference
-            st.markdown("**Patient Parameters Used:**")
-            col1, col2 = st.columns(2)
-            with col1:
-                st.write(f"- Breslow Thickness: {breslow} mm")
-                st.write(f"- Ki67 Index: {ki67}%")
-            with col2:
-                st.write(f"- Subungual Melanoma: {subungual}")
-                st.write(f"- Prior Treatment: {treatment}")
-
-        except Exception as e:
-            st.error(f"Prediction failed: {str(e)}")
-            st.info("Please check your input values and try again")
-
-# Footer
-st.markdown("---")
-st.markdown("""
-*Clinical Decision Support Tool v1.0*  
-*For physician use only - Not a substitute for clinical judgment*
-""")
+import os
+
+# Pin the math libraries to one thread before numpy loads them: for a
+# 4-feature single-row forward the work is far below the cost of an
+# OpenMP fork/join per call. setdefault keeps deployments overridable.
+os.environ.setdefault('OMP_NUM_THREADS', '1')
+os.environ.setdefault('OPENBLAS_NUM_THREADS', '1')
+os.environ.setdefault('MKL_NUM_THREADS', '1')
+
+import joblib
+import json
+import onnxruntime as ort
+import queue
+import streamlit as st
+import threading
+import time
+import numpy as np
+from multiprocessing import shared_memory, resource_tracker
+
+# Belt and braces for pools that ignore the env vars (threadpoolctl
+# ships with scikit-learn, but the app runs without it too)
+try:
+    import threadpoolctl
+    threadpoolctl.threadpool_limits(1)
+except ImportError:
+    pass
+
+# Numba is optional: when present, the weight-based predictor compiles a
+# scalar kernel specialized for the fixed 4-feature input
+try:
+    from numba import njit
+except ImportError:
+    njit = None
+
+# Custom styling (module-level constant: parsed once, not per rerun)
+_CSS = """
+<style>
+    .header-style { font-size:24px; font-weight:bold; color:#2a52be; }
+    .result-positive { color:#d62728; font-weight:bold; font-size:28px; }
+    .result-negative { color:#2ca02c; font-weight:bold; font-size:28px; }
+    .feature-header { font-size:18px; font-weight:bold; color:#2a52be; margin-top:15px; }
+</style>
+"""
+
+# Page config persists for the session, so only the first run sends it
+if 'bootstrapped' not in st.session_state:
+    st.set_page_config(
+        page_title="Melanoma SLN Metastasis Predictor",
+        layout="centered",
+        page_icon=":hospital:"
+    )
+    st.session_state.bootstrapped = True
+
+# The style element must go out on every run: Streamlit prunes elements
+# a rerun does not re-emit, and results only ever render on a rerun
+st.markdown(_CSS, unsafe_allow_html=True)
+
+# Model paths (ONNX graphs exported by export_onnx.py, pickle as fallback).
+# The int8 graph is opt-in: generate it with export_onnx.py and validate
+# decisions against the fp32 graph before deploying it. All paths are
+# resolved once, relative to this module, so the app is independent of
+# the working directory `streamlit run` happens to be launched from.
+_APP_DIR = os.path.dirname(os.path.abspath(__file__))
+INT8_MODEL_PATH = os.path.join(_APP_DIR, 'model.int8.onnx')
+ONNX_MODEL_PATH = os.path.join(_APP_DIR, 'model.onnx')
+NPZ_MODEL_PATH = os.path.join(_APP_DIR, 'mlp.npz')
+SHM_INDEX_PATH = os.path.join(_APP_DIR, 'mlp_shm.json')
+MODEL_PATH = os.path.join(_APP_DIR, 'best_mlp_model.pkl')
+
+# Preallocated input buffer: one row of
+# [Subtype, Breslow_Thickness, Ki67, Supplementary_Check]
+# float32 to match the ONNX graph's input tensor
+_INPUT_BUF = np.empty((1, 4), dtype=np.float32)
+
+if njit is not None:
+    @njit(cache=True)
+    def _scalar_forward4(x0, x1, x2, x3, W0, b0, W1, b1):
+        """Fused relu-hidden forward for one 4-feature row, returns the logit
+
+        The first layer is unrolled over the four inputs; units that relu
+        to zero contribute nothing to the output logit, so the second
+        matmul folds into the same loop. The sigmoid is left to the
+        caller: the risk decision only needs the sign of the logit.
+        cache=True persists the compiled kernel across Streamlit reruns.
+        """
+        logit = b1[0]
+        for j in range(W0.shape[1]):
+            h = (x0 * W0[0, j] + x1 * W0[1, j]
+                 + x2 * W0[2, j] + x3 * W0[3, j] + b0[j])
+            if h > 0.0:
+                logit += h * W1[j, 0]
+        return logit
+
+_ACTIVATIONS = {
+    'relu': lambda h: np.maximum(h, 0.0, out=h),
+    'tanh': np.tanh,
+    'logistic': lambda h: 1.0 / (1.0 + np.exp(-h)),
+    'identity': lambda h: h,
+}
+
+class _NumpyMLP:
+    """Thin forward pass over an MLPClassifier's learned weights
+
+    Skips sklearn's per-call input validation and Python layer machinery;
+    the handful of matmuls go straight to BLAS.
+    """
+
+    def __init__(self, coefs, intercepts, activation, out_activation):
+        self.coefs = [np.ascontiguousarray(W, dtype=np.float32) for W in coefs]
+        self.intercepts = [np.ascontiguousarray(b, dtype=np.float32) for b in intercepts]
+        self.activation = _ACTIVATIONS[activation]
+        self.binary = out_activation == 'logistic'
+        self._buf = np.empty((1, self.coefs[0].shape[0]), dtype=np.float32)
+        # Scalar kernel only covers the shape this app serves:
+        # 4 inputs, one relu hidden layer, logistic output
+        self._scalar = (njit is not None and len(self.coefs) == 2
+                        and self.coefs[0].shape[0] == 4
+                        and activation == 'relu' and self.binary)
+
+    @classmethod
+    def from_sklearn(cls, model):
+        return cls(model.coefs_, model.intercepts_,
+                   model.activation, model.out_activation_)
+
+    @classmethod
+    def from_npz(cls, archive):
+        """Build from a raw weight archive written by export_npz.py"""
+        n_layers = sum(1 for key in archive.files if key.startswith('W'))
+        return cls([archive[f'W{i}'] for i in range(n_layers)],
+                   [archive[f'b{i}'] for i in range(n_layers)],
+                   str(archive['activation']), str(archive['out_activation']))
+
+    @classmethod
+    def from_shared_memory(cls, index_path):
+        """Attach to weights published by shm_bootstrap.py
+
+        The views wrap the shared segment directly, so every worker on
+        the host serves from the same physical pages.
+        """
+        with open(index_path) as f:
+            index = json.load(f)
+        shm = shared_memory.SharedMemory(name=index['shm_name'])
+        # Attaching registers the segment with this process's resource
+        # tracker, which would unlink it for everyone on worker exit
+        resource_tracker.unregister(shm._name, 'shared_memory')
+
+        def view(entry):
+            return np.ndarray(tuple(entry['shape']), dtype=entry['dtype'],
+                              buffer=shm.buf, offset=entry['offset'])
+
+        n_layers = sum(1 for key in index['arrays'] if key.startswith('W'))
+        mlp = cls([view(index['arrays'][f'W{i}']) for i in range(n_layers)],
+                  [view(index['arrays'][f'b{i}']) for i in range(n_layers)],
+                  index['activation'], index['out_activation'])
+        mlp._shm = shm  # keep the mapping alive as long as the views
+        return mlp
+
+    def logit_one(self, x0, x1, x2, x3):
+        """Positive-class logit for a single row of features
+
+        probability >= 0.5 is exactly logit >= 0, so callers can branch
+        on the sign and apply the sigmoid only when the probability is
+        actually displayed.
+        """
+        if self._scalar:
+            return float(_scalar_forward4(x0, x1, x2, x3,
+                                          self.coefs[0], self.intercepts[0],
+                                          self.coefs[1], self.intercepts[1]))
+        self._buf[0, 0] = x0
+        self._buf[0, 1] = x1
+        self._buf[0, 2] = x2
+        self._buf[0, 3] = x3
+        return float(self.logits(self._buf)[0])
+
+    def logits(self, X):
+        """Positive-class logits for a (B, n) batch (binary models only)"""
+        h = X
+        for W, b in zip(self.coefs[:-1], self.intercepts[:-1]):
+            h = self.activation(h @ W + b)
+        z = h @ self.coefs[-1] + self.intercepts[-1]
+        if self.binary:
+            return z[:, 0]
+        # Multi-class nets have no single decision logit; fall back to the
+        # log-odds of the positive class
+        p = self.predict_proba(X)[:, 1]
+        return np.log(p / (1.0 - p))
+
+    def predict_proba(self, X):
+        h = X
+        for W, b in zip(self.coefs[:-1], self.intercepts[:-1]):
+            h = self.activation(h @ W + b)
+        z = h @ self.coefs[-1] + self.intercepts[-1]
+        if self.binary:
+            p = 1.0 / (1.0 + np.exp(-z))
+            return np.hstack([1.0 - p, p])
+        e = np.exp(z - z.max(axis=1, keepdims=True))
+        return e / e.sum(axis=1, keepdims=True)
+
+# How long the batcher waits for more sessions to join a batch
+_BATCH_WINDOW_S = 0.005
+
+class _MicroBatcher:
+    """Coalesces concurrent sessions' predictions into one batched call
+
+    Streamlit runs each session in its own thread of one process, so
+    under load several submit handlers can arrive within milliseconds.
+    Each session drops its feature row on a shared queue and blocks on a
+    per-request event; a daemon worker collects rows for up to
+    _BATCH_WINDOW_S, runs one batched forward pass, and hands every
+    session its probability. A lone request keeps the single-row path.
+    """
+
+    def __init__(self, predict_one, predict_batch):
+        self._predict_one = predict_one
+        self._predict_batch = predict_batch
+        self._queue = queue.Queue()
+        threading.Thread(target=self._run, daemon=True).start()
+
+    def predict(self, row):
+        done = threading.Event()
+        slot = [None]
+        self._queue.put((row, done, slot))
+        done.wait()
+        if isinstance(slot[0], Exception):
+            raise slot[0]
+        return slot[0]
+
+    def _run(self):
+        while True:
+            pending = [self._queue.get()]
+            deadline = time.monotonic() + _BATCH_WINDOW_S
+            while True:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    pending.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            try:
+                if len(pending) == 1:
+                    results = [self._predict_one(*pending[0][0])]
+                else:
+                    batch = np.array([p[0] for p in pending], dtype=np.float32)
+                    results = self._predict_batch(batch)
+            except Exception as exc:
+                results = [exc] * len(pending)
+            for (_, done, slot), result in zip(pending, results):
+                slot[0] = result
+                done.set()
+
+def _warm_up(m):
+    """Run one throwaway prediction so BLAS scratch buffers, ORT
+    allocators and any Numba compilation are paid at load time instead
+    of on the user's first click"""
+    if isinstance(m, ort.InferenceSession):
+        m.run(None, {'X': np.zeros((1, 4), dtype=np.float32)})
+    else:
+        m.logit_one(0.0, 0.0, 0.0, 0.0)
+    return m
+
+@st.cache_resource
+def load_model(model_path):
+    """Load trained model"""
+    try:
+        # Weights published to shared memory (shm_bootstrap.py) are an
+        # explicit operator opt-in and win over the shipped artifacts:
+        # every worker on the host maps the same segment, O(1) RAM total
+        if os.path.exists(SHM_INDEX_PATH):
+            try:
+                return _warm_up(_NumpyMLP.from_shared_memory(SHM_INDEX_PATH))
+            except FileNotFoundError:
+                # Segments do not survive a reboot but the index file
+                # does; serve from the shipped artifacts rather than
+                # taking the app down over stale deployment state
+                st.warning("Shared-memory index is stale (segment not "
+                           "found); falling back to on-disk model files")
+
+        # Prefer a compiled ONNX graph: C++ dispatch, no Python layer loops.
+        # int8 first if it has been generated and validated for this deploy.
+        for onnx_path in (INT8_MODEL_PATH, ONNX_MODEL_PATH):
+            if os.path.exists(onnx_path):
+                so = ort.SessionOptions()
+                # Single-row inference: thread spawn costs more than the matmuls
+                so.intra_op_num_threads = 1
+                return _warm_up(
+                    ort.InferenceSession(onnx_path, sess_options=so,
+                                         providers=['CPUExecutionProvider']))
+
+        # Raw weight archive (export_npz.py): no pickle unmarshalling
+        if os.path.exists(NPZ_MODEL_PATH):
+            return _warm_up(_NumpyMLP.from_npz(np.load(NPZ_MODEL_PATH)))
+
+        # Dispatch on the file header instead of a try/except cascade that
+        # swallows errors and deserializes the file up to twice
+        with open(model_path, 'rb') as f:
+            header = f.read(2)
+        if header == b'PK':
+            # zip archive: a weight .npz saved under the pickle path
+            return _warm_up(_NumpyMLP.from_npz(np.load(model_path)))
+        if header[:1] != b'\x80':
+            raise Exception(f"Unrecognized model format in {model_path}")
+
+        # Pickle protocol marker: joblib archives are pickle files too, so
+        # one joblib.load covers both. mmap_mode only spares the unpickler
+        # a transient copy of each array; _NumpyMLP then takes its own
+        # float32 copies, so cross-worker weight sharing comes from
+        # shm_bootstrap.py, not from this mapping.
+        loaded = joblib.load(model_path, mmap_mode='r')
+        if isinstance(loaded, dict) and 'model' in loaded:
+            loaded = loaded['model']
+        if hasattr(loaded, 'coefs_'):
+            return _warm_up(_NumpyMLP.from_sklearn(loaded))
+
+        raise Exception("No valid model found")
+    except Exception as e:
+        st.error(f"Model loading failed: {str(e)}")
+        return None
+
+# Load model
+model = load_model(MODEL_PATH)
+if model is None:
+    st.stop()
+
+def _to_logit(p):
+    """Log-odds of a probability, for backends that only expose proba"""
+    p = min(max(p, 1e-7), 1.0 - 1e-7)
+    return float(np.log(p / (1.0 - p)))
+
+def _predict_one(subtype, breslow, ki67, supp):
+    """Positive-class logit for one patient"""
+    if isinstance(model, ort.InferenceSession):
+        _INPUT_BUF[0, 0] = subtype
+        _INPUT_BUF[0, 1] = breslow
+        _INPUT_BUF[0, 2] = ki67
+        _INPUT_BUF[0, 3] = supp
+        # Outputs are [label, probabilities]; take the positive class.
+        # The ONNX graph bakes in its own sigmoid, so recover the logit.
+        return _to_logit(model.run(None, {'X': _INPUT_BUF})[1][0][1])
+    return model.logit_one(subtype, breslow, ki67, supp)
+
+def _predict_batch(X):
+    """Positive-class logits for a (B, 4) float32 batch"""
+    if isinstance(model, ort.InferenceSession):
+        return [_to_logit(p) for p in model.run(None, {'X': X})[1][:, 1]]
+    return [float(z) for z in model.logits(X)]
+
+@st.cache_resource
+def _get_batcher():
+    """One process-wide batching worker shared by all sessions"""
+    return _MicroBatcher(_predict_one, _predict_batch)
+
+@st.cache_data(max_entries=4096)
+def _predict(subtype, breslow, ki67, supp):
+    """Positive-class logit, cached per input tuple; misses go through
+    the micro-batcher"""
+    return _get_batcher().predict((subtype, breslow, ki67, supp))
+
+# App header
+st.title("Melanoma Sentinel Lymph Node Metastasis Predictor")
+st.markdown("<div class='header-style'>Clinical Decision Support Tool</div>", unsafe_allow_html=True)
+
+# Input features
+with st.form("patient_parameters"):
+    st.markdown("<div class='feature-header'>Tumor Characteristics</div>", unsafe_allow_html=True)
+    breslow = st.slider("Breslow Thickness (mm)", 0.0, 10.0, 4.0, 0.1,
+                        help="Measured depth of tumor invasion")
+    ki67 = st.slider("Ki67 Proliferation Index (%)", 0.0, 100.0, 0.0, 0.1,
+                     help="Percentage of Ki67-positive tumor cells")
+
+    st.markdown("<div class='feature-header'>Clinical Features</div>", unsafe_allow_html=True)
+    # Radios carry the encoded feature value directly; format_func keeps
+    # the Yes/No labels so the submit branch does no string comparisons
+    subungual = st.radio("Subungual Melanoma?", options=[0, 1],
+                         format_func=lambda v: "Yes" if v else "No",
+                         help="Is the melanoma located under the nail?")
+    treatment = st.radio("Prior Treatment Received?", options=[0, 1],
+                         format_func=lambda v: "Yes" if v else "No",
+                         help="Has the patient received any prior treatment?")
+
+    submitted = st.form_submit_button("Calculate Metastasis Risk")
+
+# Prediction and display live in a fragment so interactions inside the
+# result block rerun only this function, not the form or page chrome
+@st.fragment
+def run_and_show(subungual, breslow, ki67, treatment):
+    with st.spinner("Analyzing patient data..."):
+        try:
+            # Round the slider values to their 0.1 step so repeated
+            # submissions with the same settings hit the cache
+            logit = _predict(subungual,
+                             round(breslow, 1),
+                             round(ki67, 1),
+                             treatment)
+
+            # The risk branch needs only the sign of the logit; the
+            # sigmoid is applied once, for the displayed percentage
+            probability = 1.0 / (1.0 + np.exp(-logit))
+
+            # Display prediction result
+            st.markdown("---")
+            if logit >= 0.0:
+                st.markdown(
+                    f"<div class='result-positive'>High Risk: {probability:.1%} probability of metastasis</div>",
+                    unsafe_allow_html=True)
+            else:
+                st.markdown(f"<div class='result-negative'>Low Risk: {probability:.1%} probability of metastasis</div>",
+                            unsafe_allow_html=True)
+
+            # Display input values for reference
+            # One markdown element instead of columns plus four st.write
+            # calls: a single ForwardMsg over the WebSocket per prediction
+            st.markdown(
+                f"""**Patient Parameters Used:**
+<table>
+  <tr><td>Breslow Thickness</td><td>{breslow} mm</td>
+      <td>Subungual Melanoma</td><td>{'Yes' if subungual else 'No'}</td></tr>
+  <tr><td>Ki67 Index</td><td>{ki67}%</td>
+      <td>Prior Treatment</td><td>{'Yes' if treatment else 'No'}</td></tr>
+</table>""",
+                unsafe_allow_html=True)
+
+        except Exception as e:
+            st.error(f"Prediction failed: {str(e)}")
+            st.info("Please check your input values and try again")
+
+if submitted:
+    run_and_show(subungual, breslow, ki67, treatment)
+
+# Footer
+st.markdown("---")
+st.markdown("""
+*Clinical Decision Support Tool v1.0*  
+*For physician use only - Not a substitute for clinical judgment*
+""")